@@ -0,0 +1,194 @@
+import numpy as np
+import math
+import os
+
+# Shared fitting code for final_fit.py and "initial fits.py"
+# (the latter cannot be imported by name because of the space).
+
+# Optional: numexpr fuses the exp() expressions into one multithreaded pass
+try:
+    import numexpr as ne
+    ne.set_num_threads(os.cpu_count())
+except ImportError:
+    ne = None
+
+# Solver stopping criteria. least_squares has no check_finite scan;
+# non-finite rows are instead dropped once, when each CSV is loaded.
+SOLVER_OPTIONS = dict(xtol=1e-6, ftol=1e-6, gtol=1e-6, max_nfev=200)
+
+# --- Models ---
+# Single: N(t) = A * exp(-t/tau) + c
+# Double: N(t) = A1 * exp(-t/tau1) + A2 * exp(-t/tau2) + c
+# tau = mean lifetime (seconds)
+
+# exp(-t/tau) without the intermediate -t/tau array when numexpr is available
+def decay(t, tau):
+    if ne is not None:
+        return ne.evaluate('exp(-t / tau)')
+    return np.exp(-t / tau)
+
+# Plain model evaluations, for reuse by other scripts (the fits themselves use
+# model_and_jac_* below)
+def model_single(t, A, tau, c):
+    return A * decay(t, tau) + c
+
+def model_double(t, A1, tau1, A2, tau2, c):
+    return A1 * decay(t, tau1) + A2 * decay(t, tau2) + c
+
+# Optional: numba compiles the model + Jacobian into one threaded loop.
+# Imported on first use, like least_squares in fit_weighted(): numba (and the
+# SciPy it pulls in) would otherwise cost more at import than everything else.
+# Holds (single, double) once loaded, or False when numba is not installed.
+_kernels = None
+
+def _get_kernels():
+    global _kernels
+    if _kernels is not None:
+        return _kernels
+    try:
+        from numba import njit, prange
+    except ImportError:
+        _kernels = False
+        return _kernels
+
+    # Same maths as the NumPy fallbacks in model_and_jac_* below
+    @njit(parallel=True, fastmath=True, cache=True)
+    def kernel_single(t, A, tau, c):
+        yfit = np.empty_like(t)
+        J = np.empty((t.size, 3), dtype=t.dtype)
+        for k in prange(t.size):
+            e = math.exp(-t[k] / tau)
+            yfit[k] = A * e + c
+            J[k, 0] = e
+            J[k, 1] = A * t[k] / tau**2 * e
+            J[k, 2] = 1.0
+        return yfit, J
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def kernel_double(t, A1, tau1, A2, tau2, c):
+        yfit = np.empty_like(t)
+        J = np.empty((t.size, 5), dtype=t.dtype)
+        for k in prange(t.size):
+            e1 = math.exp(-t[k] / tau1)
+            e2 = math.exp(-t[k] / tau2)
+            yfit[k] = A1 * e1 + A2 * e2 + c
+            J[k, 0] = e1
+            J[k, 1] = A1 * t[k] / tau1**2 * e1
+            J[k, 2] = e2
+            J[k, 3] = A2 * t[k] / tau2**2 * e2
+            J[k, 4] = 1.0
+        return yfit, J
+
+    _kernels = (kernel_single, kernel_double)
+    return _kernels
+
+# Compile (or load from the on-disk cache) the kernels for both the float32
+# fitting path and the float64 check, so that cost is not timed as part of the
+# first fit. Called from the scripts' main(), not at import.
+def warm_up():
+    kernels = _get_kernels()
+    if not kernels:
+        return
+    kernel_single, kernel_double = kernels
+    for dt in (np.float32, np.float64):
+        one = dt(1.0)
+        kernel_single(np.ones(1, dtype=dt), one, one, one)
+        kernel_double(np.ones(1, dtype=dt), one, one, one, one, one)
+
+# Cap numexpr's and numba's thread pools, e.g. to one per process when the
+# caller is already running one process per core
+def set_num_threads(n):
+    if ne is not None:
+        ne.set_num_threads(n)
+    if _get_kernels():
+        import numba
+        numba.set_num_threads(n)
+
+# Model + analytic Jacobian (columns = d/dparam) from a single exp() evaluation
+def model_and_jac_single(t, A, tau, c):
+    kernels = _get_kernels()
+    if kernels:
+        return kernels[0](t, A, tau, c)
+    e = decay(t, tau)
+    J = np.stack([e, A * t / tau**2 * e, np.ones_like(t)], axis=1)
+    return A * e + c, J
+
+def model_and_jac_double(t, A1, tau1, A2, tau2, c):
+    kernels = _get_kernels()
+    if kernels:
+        return kernels[1](t, A1, tau1, A2, tau2, c)
+    e1 = decay(t, tau1)
+    e2 = decay(t, tau2)
+    J = np.stack([e1, A1 * t / tau1**2 * e1, e2, A2 * t / tau2**2 * e2, np.ones_like(t)], axis=1)
+    return A1 * e1 + A2 * e2 + c, J
+
+# --- Weighted Fit ---
+# least_squares asks for the residual and then the Jacobian at the same p,
+# so both are cached from one model_and_jac call instead of redoing the exp().
+# The model is evaluated in float32 (tau is limited by shot noise, not by
+# mantissa bits); residuals and Jacobian are upcast to float64 for the solver.
+def fit_weighted(model_and_jac, t, y, sigma, p0, bounds):
+    from scipy.optimize import least_squares
+
+    def solve(dtype):
+        t_work = t.astype(dtype, copy=False)
+        cache = {'p': None}
+
+        def evaluate(p):
+            if cache['p'] is None or not np.array_equal(p, cache['p']):
+                yfit, J = model_and_jac(t_work, *p.astype(dtype))
+                cache['p'] = p.copy()
+                cache['r'] = (yfit - y) / sigma
+                cache['J'] = J / sigma[:, None]
+            return cache
+
+        fun = lambda p: evaluate(p)['r']
+        jac = lambda p: evaluate(p)['J']
+
+        # Unbounded Levenberg-Marquardt first: the amplitude and tau >= 0 bounds
+        # are rarely active at the optimum. Fall back to bounded trf only if LM
+        # fails or lands outside them.
+        res = least_squares(fun, p0, jac=jac, method='lm', x_scale='jac', **SOLVER_OPTIONS)
+        if not res.success or np.any(res.x < bounds[0]) or np.any(res.x > bounds[1]):
+            res = least_squares(fun, p0, jac=jac, bounds=bounds, method='trf', x_scale='jac',
+                                **SOLVER_OPTIONS)
+        if not res.success:
+            raise RuntimeError(f"Optimal parameters not found: {res.message}")
+        return res
+
+    res = solve(np.float32)
+
+    # Re-check the float32 solution in float64; refit in float64 if the
+    # RMSE disagrees in the 4th significant figure.
+    yfit, J = model_and_jac(t, *res.x)
+    resid = yfit - y
+    rmse32 = np.sqrt(np.mean((res.fun * sigma)**2))
+    rmse64 = np.sqrt(np.mean(resid**2))
+    if np.isclose(rmse32, rmse64, rtol=1e-4, atol=0):
+        J = J / sigma[:, None]
+    else:
+        res = solve(np.float64)
+        resid = res.fun * sigma
+        J = res.jac
+
+    # Covariance from the float64 weighted Jacobian (absolute sigma, same SVD as curve_fit)
+    _, s, VT = np.linalg.svd(J, full_matrices=False)
+    keep = s > np.finfo(float).eps * max(J.shape) * s[0]
+    pcov = (VT[keep].T / s[keep]**2) @ VT[keep]
+    # Unweighted float64 residuals (model - y) at the solution, so callers
+    # get yfit and RMSE without another exp() sweep
+    return res.x, pcov, resid
+
+# --- Initial Guesses ---
+# A straight line through log(y - c) vs t gives A and tau in closed form,
+# so the fit starts next to the optimum and needs fewer iterations.
+# Points are weighted by sqrt(counts), since var(log N) ~ 1/N for Poisson N.
+def log_linear_guess(t, y, c, weighted=True):
+    mask = y > c + 1
+    if mask.sum() < 2:
+        return None
+    w = np.sqrt(y[mask] - c) if weighted else None
+    slope, intercept = np.polyfit(t[mask], np.log(y[mask] - c), 1, w=w)
+    if slope >= 0: # Not decaying; let the caller fall back
+        return None
+    return np.exp(intercept), -1 / slope
\ No newline at end of file
@@ -1,9 +1,19 @@
 import numpy as np
-from scipy.optimize import curve_fit
-import matplotlib.pyplot as plt
-import csv
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+import io
+import multiprocessing
 import os
 
+# model_single/model_double are re-exported for scripts that import them from here
+from decay_fit import (fit_weighted, log_linear_guess, set_num_threads, warm_up,
+                       model_single, model_double,
+                       model_and_jac_single, model_and_jac_double)
+
+# HEADLESS=1 renders with Agg and saves a PNG instead of opening a window
+HEADLESS = os.environ.get('HEADLESS', '').strip().lower() not in ('', '0', 'false', 'no', 'off')
+
 # --- 1. USER CONFIGURATION ---
 # Options: 'single' or 'double'
 FIT_TYPES = {
@@ -17,156 +27,247 @@ FIT_TYPES = {
 COL_TIME = 'Time'
 COL_SIGNAL = 'Signal' 
 
+# Fit the files in parallel worker processes once any file is at least this
+# big (~750k rows). Measured: a spawned worker takes ~1.5 s to start (imports
+# plus kernel warm-up), while a file costs ~0.14 s per MB serially, so below
+# this the serial run (whose kernels are threaded anyway) finishes first.
+PARALLEL_MIN_BYTES = 8_000_000
+MAX_WORKERS = 4
+
 # Constants
 LN2 = np.log(2)
 
-# --- 2. Model Definitions ---
+# --- 2. Initial Guesses ---
+def guess_single(t, y):
+    c_guess = y.min()
+    seed = log_linear_guess(t, y, c_guess)
+    if seed is None:
+        return [np.ptp(y), (t.max() - t.min())/3, c_guess]
+    return [*seed, c_guess]
 
-# Single: N(t) = A * exp(-t/tau) + c
-def model_single(t, A, tau, c):
-    return A * np.exp(-t / tau) + c
+def guess_double(t, y):
+    amp_span, duration = np.ptp(y), t.max() - t.min()
+    fallback = [amp_span/2, duration/10, amp_span/2, duration/2, y.min()]
 
-# Double: N(t) = A1 * exp(-t/tau1) + A2 * exp(-t/tau2) + c
-def model_double(t, A1, tau1, A2, tau2, c):
-    return A1 * np.exp(-t / tau1) + A2 * np.exp(-t / tau2) + c
+    # Peel-off: the slow component (with the background lumped in) dominates
+    # the late half, so fit it there, subtract it, and fit what is left of the
+    # early half for the fast component. Unweighted: with the background folded
+    # into the tail, count weighting only pulls the seeds further off.
+    late = t >= np.median(t)
+    slow = log_linear_guess(t[late], y[late], 0, weighted=False)
+    if slow is None:
+        return fallback
+    A2, tau2 = slow
+    fast = log_linear_guess(t[~late], (y - A2 * np.exp(-t / tau2))[~late], 0, weighted=False)
+    if fast is None:
+        return fallback
+    A1, tau1 = fast
+    return [A1, tau1, A2, tau2, 0]
+
+# --- Reporting ---
+# Print the fitted parameters and return the graph label
+def report_single(popt, pcov):
+    A, tau, c = popt
+    perr = np.sqrt(np.diag(pcov))
+    tau_err = perr[1]
+    
+    # Calculations
+    t_half = tau * LN2
+    t_half_err = tau_err * LN2
+    
+    # Print Info
+    print(f"  > Tau       : {tau:.4f} +/- {tau_err:.4f} s")
+    print(f"  > Half-Life : {t_half:.4f} +/- {t_half_err:.4f} s")
+    print(f"  > Abundance : 100%")
 
-# --- 3. Plotting Setup ---
-plt.close('all')
-fig, axes = plt.subplots(2, 2, figsize=(14, 11)) # Slightly taller for extra text
-fig.suptitle("Radioactive Decay Analysis (Half-Life & Abundance)", fontsize=16)
-ax_list = axes.flatten()
+    # Graph Label
+    return (rf'$T_{{1/2}} = {t_half:.3f} \pm {t_half_err:.3f}$ s' + '\n' +
+            r'(Abundance: 100%)')
 
-# --- 4. Main Loop ---
-for i in range(1, 5):
+def report_double(popt, pcov):
+    A1, tau1, A2, tau2, c_val = popt
+    perr = np.sqrt(np.diag(pcov))
     
+    # Calculations (Half Lives)
+    t1_half = tau1 * LN2
+    t1_half_err = perr[1] * LN2
+    
+    t2_half = tau2 * LN2
+    t2_half_err = perr[3] * LN2
+    
+    # Calculations (Abundance)
+    total_amp = A1 + A2
+    abund1 = (A1 / total_amp) * 100
+    abund2 = (A2 / total_amp) * 100
+
+    # Print Info
+    print(f"  --- Component 1 (Fast?) ---")
+    print(f"  > Tau       : {tau1:.4f} +/- {perr[1]:.4f} s")
+    print(f"  > Half-Life : {t1_half:.4f} +/- {t1_half_err:.4f} s")
+    print(f"  > Abundance : {abund1:.1f}%")
+    print(f"  --- Component 2 (Slow?) ---")
+    print(f"  > Tau       : {tau2:.4f} +/- {perr[3]:.4f} s")
+    print(f"  > Half-Life : {t2_half:.4f} +/- {t2_half_err:.4f} s")
+    print(f"  > Abundance : {abund2:.1f}%")
+
+    # Graph Label (Compacted for space)
+    return (rf'$T_{{1/2,1}} = {t1_half:.2f} \pm {t1_half_err:.2f}$ s ({abund1:.0f}%)' + '\n' + 
+            rf'$T_{{1/2,2}} = {t2_half:.2f} \pm {t2_half_err:.2f}$ s ({abund2:.0f}%)')
+
+# --- Fit Dispatch ---
+# Everything a fit type needs, looked up once per file instead of branching
+FitSpec = namedtuple('FitSpec', ['model_and_jac', 'guess', 'bounds', 'report'])
+
+FIT_SPECS = {
+    'single': FitSpec(model_and_jac_single, guess_single,
+                      ([0, 0, -np.inf], [np.inf, np.inf, np.inf]), report_single),
+    'double': FitSpec(model_and_jac_double, guess_double,
+                      ([0, 0, 0, 0, -np.inf], [np.inf, np.inf, np.inf, np.inf, np.inf]), report_double),
+}
+
+# --- 3. Per-File Analysis ---
+def analyze_file(i):
     filename = f'single_channel_data_{i}.csv'
-    current_ax = ax_list[i-1]
     fit_type = FIT_TYPES[i]
+    result = {'index': i, 'fit_type': fit_type, 'status': 'ok'}
     
     print(f"\n{'='*40}")
     print(f"Processing File {i}: {filename} ({fit_type} fit)")
     print(f"{'='*40}")
 
     # --- A. Load Data ---
-    time_list, signal_list = [], []
     if not os.path.exists(filename):
         print(f"Error: {filename} not found.")
-        current_ax.text(0.5, 0.5, "File Not Found", ha='center')
-        continue
+        result['status'] = 'missing'
+        return result
 
     try:
         with open(filename, mode='r') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                time_list.append(float(row[COL_TIME]))
-                # Fallback if specific column name is missing
-                try:
-                    signal_list.append(float(row[COL_SIGNAL]))
-                except KeyError:
-                    signal_list.append(float(row[list(row.keys())[1]]))
+            headers = [h.strip() for h in file.readline().split(',')]
+        time_idx = headers.index(COL_TIME)
+        # Fallback if specific column name is missing
+        signal_idx = headers.index(COL_SIGNAL) if COL_SIGNAL in headers else 1
+
+        raw_time, raw_signal = np.loadtxt(filename, delimiter=',', skiprows=1,
+                                          usecols=(time_idx, signal_idx), ndmin=2, unpack=True)
     except Exception as e:
         print(f"Error reading file: {e}")
-        continue
+        result['status'] = 'unreadable'
+        return result
+
+    # Validate once here so the fit never sees NaN/Inf
+    finite = np.isfinite(raw_time) & np.isfinite(raw_signal)
 
     # Normalization
-    t = np.array(time_list) / 1000.0 # ms to s
-    y = np.array(signal_list)
+    t = raw_time[finite] / 1000.0 # ms to s
+    y = raw_signal[finite]
+    result['t'], result['y'] = t, y
     
     # Weights for fitting
     sigma = np.sqrt(np.clip(y, 1, None))
 
     # --- B. Fitting & Calculations ---
     try:
-        amp_span = max(y) - min(y)
-        c_guess = min(y)
-        duration = t.max() - t.min()
-
-        if fit_type == 'single':
-            # --- Single Fit ---
-            p0 = [amp_span, duration/3, c_guess]
-            bounds = ([0, 0, -np.inf], [np.inf, np.inf, np.inf])
-            
-            popt, pcov = curve_fit(model_single, t, y, p0=p0, sigma=sigma, absolute_sigma=True, bounds=bounds)
-            
-            A, tau, c = popt
-            perr = np.sqrt(np.diag(pcov))
-            tau_err = perr[1]
-            
-            # Calculations
-            t_half = tau * LN2
-            t_half_err = tau_err * LN2
-            
-            yfit = model_single(t, *popt)
-            
-            # Print Info
-            print(f"  > Tau       : {tau:.4f} +/- {tau_err:.4f} s")
-            print(f"  > Half-Life : {t_half:.4f} +/- {t_half_err:.4f} s")
-            print(f"  > Abundance : 100%")
-
-            # Graph Label
-            label_text = (rf'$T_{{1/2}} = {t_half:.3f} \pm {t_half_err:.3f}$ s' + '\n' +
-                          r'(Abundance: 100%)')
-
-        elif fit_type == 'double':
-            # --- Double Fit ---
-            p0 = [amp_span/2, duration/10, amp_span/2, duration/2, c_guess]
-            bounds = ([0, 0, 0, 0, -np.inf], [np.inf, np.inf, np.inf, np.inf, np.inf])
-            
-            popt, pcov = curve_fit(model_double, t, y, p0=p0, sigma=sigma, absolute_sigma=True, bounds=bounds)
-            
-            A1, tau1, A2, tau2, c_val = popt
-            perr = np.sqrt(np.diag(pcov))
-            
-            # Calculations (Half Lives)
-            t1_half = tau1 * LN2
-            t1_half_err = perr[1] * LN2
-            
-            t2_half = tau2 * LN2
-            t2_half_err = perr[3] * LN2
-            
-            # Calculations (Abundance)
-            total_amp = A1 + A2
-            abund1 = (A1 / total_amp) * 100
-            abund2 = (A2 / total_amp) * 100
+        spec = FIT_SPECS[fit_type]
+        popt, pcov, resid = fit_weighted(spec.model_and_jac, t, y, sigma, spec.guess(t, y), spec.bounds)
+        label_text = spec.report(popt, pcov)
+        yfit = y + resid
 
-            yfit = model_double(t, *popt)
-            
-            # Print Info
-            print(f"  --- Component 1 (Fast?) ---")
-            print(f"  > Tau       : {tau1:.4f} +/- {perr[1]:.4f} s")
-            print(f"  > Half-Life : {t1_half:.4f} +/- {t1_half_err:.4f} s")
-            print(f"  > Abundance : {abund1:.1f}%")
-            print(f"  --- Component 2 (Slow?) ---")
-            print(f"  > Tau       : {tau2:.4f} +/- {perr[3]:.4f} s")
-            print(f"  > Half-Life : {t2_half:.4f} +/- {t2_half_err:.4f} s")
-            print(f"  > Abundance : {abund2:.1f}%")
-
-            # Graph Label (Compacted for space)
-            label_text = (rf'$T_{{1/2,1}} = {t1_half:.2f} \pm {t1_half_err:.2f}$ s ({abund1:.0f}%)' + '\n' + 
-                          rf'$T_{{1/2,2}} = {t2_half:.2f} \pm {t2_half_err:.2f}$ s ({abund2:.0f}%)')
-
-        # --- C. Plotting ---
-        rmse = np.sqrt(np.mean((y - yfit)**2))
+        # --- C. Goodness of Fit ---
+        rmse = np.sqrt(np.mean(resid**2))
         print(f"  > RMSE      : {rmse:.3f}")
 
-        current_ax.plot(t, y, 'b.', alpha=0.3, markersize=3, label='Data')
-        current_ax.plot(t, yfit, 'r-', linewidth=1.5, label='Fit')
-        
-        # Annotation Box
-        current_ax.text(0.95, 0.95, label_text, transform=current_ax.transAxes, 
-                        ha='right', va='top', fontsize=9,
-                        bbox=dict(boxstyle='round', facecolor='white', alpha=0.9, edgecolor='gray'))
-        
-        current_ax.legend(loc='upper right', bbox_to_anchor=(1, 0.78))
+        result['yfit'] = yfit
+        result['label_text'] = label_text
 
     except Exception as e:
         print(f"  Fit Failed: {e}")
-        current_ax.plot(t, y, 'k.', label='Data (Fit Failed)')
+        result['status'] = 'failed'
+
+    return result
+
+# --- 4. Plotting ---
+def _plot(results):
+    # Imported here so the fits can run without loading Matplotlib
+    import matplotlib
+    if HEADLESS:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    plt.close('all')
+    fig, axes = plt.subplots(2, 2, figsize=(14, 11)) # Slightly taller for extra text
+    fig.suptitle("Radioactive Decay Analysis (Half-Life & Abundance)", fontsize=16)
+    ax_list = axes.flatten()
+
+    for result in results:
+        current_ax = ax_list[result['index']-1]
+
+        if result['status'] == 'missing':
+            current_ax.text(0.5, 0.5, "File Not Found", ha='center')
+            continue
+        if result['status'] == 'unreadable':
+            continue
+
+        t, y = result['t'], result['y']
+        stride = max(1, t.size // 2000) # At most ~2000 markers
+        if result['status'] == 'ok':
+            # Data as one raster image in PDF/SVG output; the fit line stays vector
+            current_ax.plot(t[::stride], y[::stride], 'b.', alpha=0.3, markersize=3, label='Data', rasterized=True)
+            current_ax.plot(t, result['yfit'], 'r-', linewidth=1.5, label='Fit')
+            
+            # Annotation Box
+            current_ax.text(0.95, 0.95, result['label_text'], transform=current_ax.transAxes, 
+                            ha='right', va='top', fontsize=9,
+                            bbox=dict(boxstyle='round', facecolor='white', alpha=0.9, edgecolor='gray'))
+            
+            current_ax.legend(loc='upper right', bbox_to_anchor=(1, 0.78))
+        else:
+            current_ax.plot(t[::stride], y[::stride], 'k.', label='Data (Fit Failed)', rasterized=True)
+
+        # Aesthetics
+        current_ax.set_title(f"File {result['index']}: {result['fit_type'].capitalize()} Fit")
+        current_ax.set_xlabel("Time (s)")
+        current_ax.set_ylabel("Counts")
+
+    plt.tight_layout()
+    if HEADLESS:
+        fig.savefig('final_fit.png', dpi=150)
+    else:
+        plt.show()
+
+# --- 5. Main ---
+def _analyze_file_buffered(i):
+    # Worker side: hold the printout so the files report in order, not interleaved
+    output = io.StringIO()
+    with redirect_stdout(output):
+        result = analyze_file(i)
+    return result, output.getvalue()
+
+def _init_worker():
+    # One thread per worker: the pool already occupies the cores
+    set_num_threads(1)
+    warm_up()
+
+def main():
+    indices = range(1, 5)
+    filenames = [f'single_channel_data_{i}.csv' for i in indices]
+    largest = max((os.path.getsize(f) for f in filenames if os.path.exists(f)), default=0)
+    workers = min(MAX_WORKERS, os.cpu_count() or 1, len(indices))
+
+    if workers > 1 and largest >= PARALLEL_MIN_BYTES:
+        # 'spawn' rather than fork: numba's worker threads are already running
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 mp_context=multiprocessing.get_context('spawn')) as ex:
+            results = []
+            for result, output in ex.map(_analyze_file_buffered, indices):
+                print(output, end='')
+                results.append(result)
+    else:
+        warm_up()
+        results = [analyze_file(i) for i in indices]
 
-    # Aesthetics
-    current_ax.set_title(f"File {i}: {fit_type.capitalize()} Fit")
-    current_ax.set_xlabel("Time (s)")
-    current_ax.set_ylabel("Counts")
+    # Plotting stays in the main process
+    _plot(results)
 
-plt.tight_layout()
-plt.show()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -1,114 +1,136 @@
 import numpy as np
-from scipy.optimize import curve_fit
-import matplotlib.pyplot as plt
-import csv
+import os
+
+from decay_fit import fit_weighted, log_linear_guess, model_and_jac_single, warm_up
+
+# HEADLESS=1 renders with Agg and saves a PNG instead of opening a window
+HEADLESS = os.environ.get('HEADLESS', '').strip().lower() not in ('', '0', 'false', 'no', 'off')
 
 # --- Configuration ---
 CSV_FILENAME = 'serial_5_channels.csv' # Matches your Arduino logger script
 
 # --- Load Data ---
-time_list, s1, s2, s3, s4 = [], [], [], [], []
-
-try:
-    with open(CSV_FILENAME, mode='r') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            # We assume the Arduino logger saved columns as:
-            # Time, Channel 1, Channel 2, Channel 3, Channel 4
-            time_list.append(float(row['Time']))
-            s1.append(float(row['Channel 1']))
-            s2.append(float(row['Channel 2']))
-            s3.append(float(row['Channel 3']))
-            s4.append(float(row['Channel 4']))
-except FileNotFoundError:
-    print(f"Error: Could not find file '{CSV_FILENAME}'. Check directory.")
-    exit()
-
-# Convert to numpy arrays
-raw_time = np.asarray(time_list)
-sources  = [np.asarray(s1), np.asarray(s2), np.asarray(s3), np.asarray(s4)]
-
-# --- Time Conversion ---
-# Convert ms -> s (This makes Tau readable in seconds)
-t = raw_time / 1000.0
-
-# --- Model Definition ---
-# N(t) = N0 * exp(-t/tau) + c
-# tau = mean lifetime (seconds)
-def model(x, N0, tau, c):
-    return N0 * np.exp(-x / tau) + c
-
-# --- Plotting Setup ---
-plt.close('all')
-fig, axes = plt.subplots(2, 2, figsize=(12, 10))
-fig.suptitle(f"Radioactive Decay Fits (Data: {CSV_FILENAME})", fontsize=16)
-
-for i, y in enumerate(sources):
-    
-    # 1. Intelligent Guesses
-    # N0 = Range of data, c = minimum value, tau = 1/3 of total duration
-    N0_guess  = max(y) - min(y)
-    c_guess   = min(y)
-    tau_guess = (t.max() - t.min()) / 3 if (t.max() - t.min()) > 0 else 1.0
-    
-    p0 = [N0_guess, tau_guess, c_guess]
-
-    # 2. Weighting (Poisson Statistics)
-    # Uncertainties in counts are sqrt(N). We use this to weight the fit.
-    # We clip at 1 to avoid division by zero errors if counts are 0.
-    sigma = np.sqrt(np.clip(y, 1, None))
-
-    try:
-        popt, pcov = curve_fit(
-            model, t, y,
-            p0=p0,
-            sigma=sigma,
-            absolute_sigma=True,          # True = treat sigma as absolute errors (counts)
-            bounds=([0, 0, -np.inf],      # N0 >= 0, tau >= 0, c can be anything
-                    [np.inf, np.inf, np.inf])
-        )
-        
-        perr = np.sqrt(np.diag(pcov))
-        N0, tau, c = popt
-        N0_err, tau_err, c_err = perr
-
-        # Calculate RMSE
-        yfit = model(t, *popt)
-        rmse = np.sqrt(np.mean((y - yfit)**2))
-
-        print(f"--- Source {i+1} ---")
-        print(f"  N0   = {N0:.3f} +/- {N0_err:.3f}")
-        print(f"  Tau  = {tau:.3f} s +/- {tau_err:.3f} s")
-        print(f"  c    = {c:.3f} +/- {c_err:.3f}")
-        print(f"  RMSE = {rmse:.3f}\n")
-
-        # 3. Plotting
+# We assume the Arduino logger saved columns as:
+# Time, Channel 1, Channel 2, Channel 3, Channel 4
+def load_sources(filename):
+    # Parsed in one C pass straight into float arrays (one per column)
+    data = np.loadtxt(filename, delimiter=',', skiprows=1, usecols=range(5), ndmin=2)
+    # Validate once here so the fits never see NaN/Inf
+    raw_time, s1, s2, s3, s4 = data[np.isfinite(data).all(axis=1)].T
+
+    # --- Time Conversion ---
+    # Convert ms -> s (This makes Tau readable in seconds)
+    t = raw_time / 1000.0
+    return t, [s1, s2, s3, s4]
+
+# --- Plotting ---
+def _plot(t, sources, fits):
+    # Imported here so the fits can run without loading Matplotlib
+    import matplotlib
+    if HEADLESS:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    plt.close('all')
+    fig, axes = plt.subplots(2, 2, figsize=(12, 10))
+    fig.suptitle(f"Radioactive Decay Fits (Data: {CSV_FILENAME})", fontsize=16)
+
+    for i, (y, fit) in enumerate(zip(sources, fits)):
         ax = axes[i//2, i%2]
-        
-        # Plot Data
-        ax.plot(t, y, 'b.', ms=4, alpha=0.4, label='Data')
-        
-        # Plot Fit
-        ax.plot(t, yfit, '-', color='orange', linewidth=2, label='Fit')
-
-        # Add Annotation Box
-        tau_text = rf'$\tau = {tau:.3f} \pm {tau_err:.3f}\ \mathrm{{s}}$'
-        ax.text(
-            0.95, 0.95, tau_text,
-            transform=ax.transAxes, ha='right', va='top',
-            bbox=dict(boxstyle='round', facecolor='white', alpha=0.9, edgecolor='gray'),
-            fontsize=10
-        )
-
-    except Exception as e:
-        print(f"Fit failed for Source {i+1}: {e}")
-        ax = axes[i//2, i%2]
-        ax.plot(t, y, 'b.', label='Data (Fit Failed)')
-
-    ax.set_title(f"Channel {i+1}")
-    ax.set_xlabel("Time [s]")
-    ax.set_ylabel("Counts")
-    ax.legend(loc='upper right', bbox_to_anchor=(1, 0.85)) # Move legend slightly to avoid overlap
+        stride = max(1, t.size // 2000) # At most ~2000 markers
+
+        if fit is not None:
+            yfit, tau, tau_err = fit
+
+            # Plot Data (rasterized: one image in PDF/SVG, not a path per marker)
+            ax.plot(t[::stride], y[::stride], 'b.', ms=4, alpha=0.4, label='Data', rasterized=True)
+            
+            # Plot Fit
+            ax.plot(t, yfit, '-', color='orange', linewidth=2, label='Fit')
+
+            # Add Annotation Box
+            tau_text = rf'$\tau = {tau:.3f} \pm {tau_err:.3f}\ \mathrm{{s}}$'
+            ax.text(
+                0.95, 0.95, tau_text,
+                transform=ax.transAxes, ha='right', va='top',
+                bbox=dict(boxstyle='round', facecolor='white', alpha=0.9, edgecolor='gray'),
+                fontsize=10
+            )
+
+        else:
+            ax.plot(t[::stride], y[::stride], 'b.', label='Data (Fit Failed)', rasterized=True)
+
+        ax.set_title(f"Channel {i+1}")
+        ax.set_xlabel("Time [s]")
+        ax.set_ylabel("Counts")
+        ax.legend(loc='upper right', bbox_to_anchor=(1, 0.85)) # Move legend slightly to avoid overlap
+
+    plt.tight_layout()
+    if HEADLESS:
+        fig.savefig('initial_fits.png', dpi=150)
+    else:
+        plt.show()
+
+# --- Main ---
+def main():
+    try:
+        t, sources = load_sources(CSV_FILENAME)
+    except FileNotFoundError:
+        print(f"Error: Could not find file '{CSV_FILENAME}'. Check directory.")
+        return
+    except ValueError as e: # Includes UnicodeDecodeError from stray serial bytes
+        print(f"Error reading '{CSV_FILENAME}': {e}")
+        return
+    warm_up()
 
-plt.tight_layout()
-plt.show()
\ No newline at end of file
+    # 1. Intelligent Guesses
+    # c = minimum value; N0 and tau from a log-linear fit above it.
+    # If that fails: N0 = Range of data, tau = 1/3 of total duration
+    # (the time axis is shared, so that tau guess is the same for every channel)
+    t_span    = t.max() - t.min()
+    tau_guess = t_span / 3 if t_span > 0 else 1.0
+
+    fits = []
+    for i, y in enumerate(sources):
+        c_guess   = y.min()
+        seed      = log_linear_guess(t, y, c_guess)
+        N0_guess, tau_seed = seed if seed is not None else (np.ptp(y), tau_guess)
+        p0 = [N0_guess, tau_seed, c_guess]
+
+        # 2. Weighting (Poisson Statistics)
+        # Uncertainties in counts are sqrt(N). We use this to weight the fit.
+        # We clip at 1 to avoid division by zero errors if counts are 0.
+        sigma = np.sqrt(np.clip(y, 1, None))
+
+        # 3. Fit N(t) = N0 * exp(-t/tau) + c, tau = mean lifetime (seconds)
+        # (sigma is treated as absolute errors)
+        try:
+            popt, pcov, resid = fit_weighted(
+                model_and_jac_single, t, y, sigma, p0,
+                bounds=([0, 0, -np.inf],      # N0 >= 0, tau >= 0, c can be anything
+                        [np.inf, np.inf, np.inf])
+            )
+            perr = np.sqrt(np.diag(pcov))
+            N0, tau, c = popt
+            N0_err, tau_err, c_err = perr
+
+            # Calculate RMSE from the residuals the fit already computed
+            yfit = y + resid
+            rmse = np.sqrt(np.mean(resid**2))
+
+            print(f"--- Source {i+1} ---")
+            print(f"  N0   = {N0:.3f} +/- {N0_err:.3f}")
+            print(f"  Tau  = {tau:.3f} s +/- {tau_err:.3f} s")
+            print(f"  c    = {c:.3f} +/- {c_err:.3f}")
+            print(f"  RMSE = {rmse:.3f}\n")
+
+            fits.append((yfit, tau, tau_err))
+        except Exception as e:
+            print(f"Fit failed for Source {i+1}: {e}")
+            fits.append(None)
+
+    # 4. Plotting
+    _plot(t, sources, fits)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
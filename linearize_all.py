@@ -1,12 +1,43 @@
-import matplotlib.pyplot as plt
-import csv
+import matplotlib
 import numpy as np
+import glob
 import os
 
+# HEADLESS=1 renders with Agg and saves a PNG instead of opening a window
+HEADLESS = os.environ.get('HEADLESS', '').strip().lower() not in ('', '0', 'false', 'no', 'off')
+if HEADLESS:
+    matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
 # --- Configuration ---
 # This will loop through single_channel_data_1.csv to _4.csv
 FILE_INDICES = range(1, 5) 
 
+# --- Data Loading ---
+# The first parse of each CSV is saved next to it as a .npy file; later runs
+# memory-map that instead of re-parsing text. The cache filename carries the
+# CSV's size and mtime, so any change to either (an append, or a replacement
+# copied in with an older timestamp) misses the cache and re-parses.
+def load_columns(filename):
+    st = os.stat(filename)
+    base = os.path.splitext(filename)[0]
+    cache = f'{base}.{st.st_size}-{st.st_mtime_ns}.npy'
+    if not os.path.exists(cache):
+        # First column is Time, second is the channel (header row skipped).
+        # Unparseable fields come back as NaN and short rows are skipped, so
+        # drop those rows rather than the whole channel.
+        data = np.genfromtxt(filename, delimiter=',', skip_header=1, usecols=(0, 1),
+                             invalid_raise=False, ndmin=2)
+        data = data[np.isfinite(data).all(axis=1)]
+        try:
+            # Drop caches of earlier versions of this CSV
+            for stale in glob.glob(glob.escape(base) + '.*-*.npy') + glob.glob(glob.escape(base) + '.npy'):
+                os.remove(stale)
+            np.save(cache, data)
+        except OSError:
+            return data # Read-only folder: just use the parsed copy
+    return np.load(cache, mmap_mode='r')
+
 # --- Plotting Setup ---
 # Create a 2x2 grid of plots
 plt.close('all') # Close previous windows
@@ -22,8 +53,7 @@ for i in FILE_INDICES:
     current_ax = ax_list[i-1] # Map file 1 to index 0, etc.
     
     # --- Load Data ---
-    time_list = []
-    counts_list = []
+    t, y = None, None
     
     if not os.path.exists(filename):
         # Handle missing files gracefully on the plot
@@ -32,32 +62,19 @@ for i in FILE_INDICES:
         print(f"Skipping {filename} (Not Found)")
     else:
         try:
-            with open(filename, mode='r') as file:
-                reader = csv.DictReader(file)
-                headers = reader.fieldnames
-                
-                # Auto-detect columns
-                if headers and len(headers) >= 2:
-                    time_col = headers[0]
-                    data_col = headers[1] 
-
-                    for row in reader:
-                        try:
-                            time_list.append(float(row[time_col]))
-                            counts_list.append(float(row[data_col]))
-                        except ValueError:
-                            continue
+            data = load_columns(filename)
+            # Convert Time to Seconds (assuming input is ms)
+            t = data[:, 0] / 1000.0
+            y = data[:, 1]
         except Exception as e:
             print(f"Error reading {filename}: {e}")
 
     # --- Plotting ---
-    if time_list:
-        # Convert Time to Seconds (assuming input is ms)
-        t = np.array(time_list) / 1000.0 
-        y = np.array(counts_list)
-
+    if t is not None and t.size:
         # The Magic Command for Subplots: current_ax.semilogy
-        current_ax.semilogy(t, y, '.', markersize=4, alpha=0.5, color='blue')
+        # (at most ~2000 markers, rasterized into one image in PDF/SVG output)
+        stride = max(1, t.size // 2000)
+        current_ax.semilogy(t[::stride], y[::stride], '.', markersize=4, alpha=0.5, color='blue', rasterized=True)
         
         # Add 'Grid' to make it easier to read the log scale
         current_ax.grid(True, which="both", ls="-", alpha=0.3)
@@ -70,4 +87,7 @@ for i in FILE_INDICES:
 # Adjust layout so titles and labels don't overlap
 plt.tight_layout()
 plt.subplots_adjust(top=0.92) # Leave space for the main super-title
-plt.show()
\ No newline at end of file
+if HEADLESS:
+    fig.savefig('linearize_all.png', dpi=150)
+else:
+    plt.show()
\ No newline at end of file
@@ -1,28 +1,40 @@
-import matplotlib.pyplot as plt
+import matplotlib
 import csv
 import numpy as np
+import os
+
+# HEADLESS=1 renders with Agg and saves a PNG instead of opening a window
+HEADLESS = os.environ.get('HEADLESS', '').strip().lower() not in ('', '0', 'false', 'no', 'off')
+if HEADLESS:
+    matplotlib.use('Agg')
+import matplotlib.pyplot as plt
 
 # --- Configuration ---
 FILENAME = 'single_channel_data_3.csv'
 
 # --- Load Data ---
-time_list = []
-counts_list = []
-
 try:
-    with open(FILENAME, mode='r') as file:
-        reader = csv.DictReader(file)
+    with open(FILENAME, mode='r', newline='') as file:
+        # Count the data rows first so the array is allocated once, at its
+        # final size, instead of growing Python lists of floats
+        nrows = sum(1 for line in file if line.strip()) - 1
+        file.seek(0)
+        reader = csv.reader(file)
         
         # Automatically detect column names
-        headers = reader.fieldnames
+        headers = next(reader)
         time_col = headers[0]  # First column (Time)
         data_col = headers[1]  # Second column (The Channel)
         
         print(f"Plotting '{data_col}' vs '{time_col}'")
 
+        data = np.empty((nrows, 2))
+        k = 0
         for row in reader:
-            time_list.append(float(row[time_col]))
-            counts_list.append(float(row[data_col]))
+            if row: # Skip blank lines, as DictReader did
+                data[k, 0] = float(row[0])
+                data[k, 1] = float(row[1])
+                k += 1
 
 except FileNotFoundError:
     print(f"Error: File '{FILENAME}' not found.")
@@ -30,15 +42,17 @@ except FileNotFoundError:
 
 # Convert Time to Seconds (assuming input is ms)
 # Remove the "/ 1000.0" if your CSV is already in seconds
-t = np.array(time_list) / 1000.0 
-y = np.array(counts_list)
+t = data[:k, 0] / 1000.0 
+y = data[:k, 1]
 
 # --- Plotting ---
-plt.figure(figsize=(10, 6))
+fig = plt.figure(figsize=(10, 6))
 
 # The Magic Command: semilogy
 # This plots X on a linear scale and Y on a Log scale
-plt.semilogy(t, y, 'b.', markersize=5, label='Raw Data')
+# (at most ~2000 markers, rasterized into one image in PDF/SVG output)
+stride = max(1, t.size // 2000)
+plt.semilogy(t[::stride], y[::stride], 'b.', markersize=5, label='Raw Data', rasterized=True)
 
 # Formatting
 plt.title(f"Semi-Log Plot: {data_col}")
@@ -50,4 +64,7 @@ plt.grid(True, which="both", ls="-", alpha=0.3)
 plt.legend()
 
 plt.tight_layout()
-plt.show()
\ No newline at end of file
+if HEADLESS:
+    fig.savefig('linearize_single.png', dpi=150)
+else:
+    plt.show()
\ No newline at end of file
@@ -4,7 +4,6 @@ Serial Logger (5 Columns: Time + 4 Channels)
 """
 
 import serial
-import csv
 import time
 
 # --- Configuration ---
@@ -14,6 +13,24 @@ CSV_FILENAME = 'serial_5_channels.csv'
 # NOTE: If your Arduino sends data faster than this interval, 
 # decrease this number (e.g., 0.1) or set to 0 to prevent lag.
 LOG_INTERVAL_SECONDS = 1  
+# Buffered rows are pushed to disk at most this often (and always on exit)
+FLUSH_INTERVAL_SECONDS = 1.0
+# Print every logged row (slows down fast logging)
+DEBUG = False
+
+# Non-ASCII bytes, e.g. the b'\xff\xfe' junk sent on connect. They are dropped
+# from each line before splitting, as decode(errors='ignore') used to do.
+HIGH_BYTES = bytes(range(128, 256))
+
+# float() parses bytes directly; non-numeric text such as a startup banner
+# raises ValueError
+def is_numeric(fields):
+    try:
+        for field in fields:
+            float(field)
+    except ValueError:
+        return False
+    return True
 
 def log_serial_data_to_csv(port, baud_rate, filename):
     try:
@@ -23,34 +40,48 @@ def log_serial_data_to_csv(port, baud_rate, filename):
         ser.reset_input_buffer() 
         print(f" Connected to {port} @ {baud_rate} baud.")
 
-        with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.writer(csvfile)
+        # Binary mode: serial bytes go straight to the file without decoding
+        # or re-encoding each sample. Rows end in \r\n, as csv.writer wrote them.
+        with open(filename, 'wb') as csvfile:
             
             # --- CHANGE 1: Updated Headers ---
             # Labels for the 5 columns coming from Arduino
-            writer.writerow(['Time', 'Channel 1', 'Channel 2', 'Channel 3', 'Channel 4'])
+            csvfile.write(b'Time,Channel 1,Channel 2,Channel 3,Channel 4\r\n')
 
             print(f"Logging to {filename}. Press Ctrl+C to stop.")
 
-            while True:
-                # Read a line from the serial port
-                raw_line = ser.readline().decode(errors='ignore').strip()
+            # No flush per row (one syscall per sample); leaving the 'with' block,
+            # including on Ctrl+C, flushes whatever is still buffered.
+            last_flush = time.monotonic()
 
-                if raw_line:
-                    # Split the line by whitespace (tabs or spaces)
-                    cols = raw_line.split()
+            while True:
+                # Read a line from the serial port and
+                # split it by whitespace (tabs or spaces)
+                cols = ser.readline().translate(None, HIGH_BYTES).split()
 
+                if cols:
                     # --- CHANGE 2: Capture 5 Columns ---
                     # Ensure we have at least 5 columns of data
                     if len(cols) >= 5:
                         # Slice 0:5 gets the first 5 items (Time + 4 Channels)
-                        data_row = cols[0:5]
-                        
-                        writer.writerow(data_row)
-                        csvfile.flush() # Ensure data is written immediately
-                        print(f"Logged: {data_row}")
+                        fields = cols[0:5]
+                        if is_numeric(fields):
+                            data_row = b','.join(fields)
+                            
+                            csvfile.write(data_row + b'\r\n')
+                            if DEBUG:
+                                print(f"Logged: {data_row.decode()}")
+                        else:
+                            print(f"Ignored malformed line: {b' '.join(cols).decode()}")
                     else:
-                        print(f"Ignored incomplete line: {cols}")
+                        print(f"Ignored incomplete line: {b' '.join(cols).decode()}")
+
+                # Checked on every pass, not only after a row is written, so
+                # logged rows still reach disk when the Arduino goes quiet
+                # (readline() then times out and returns b'')
+                if time.monotonic() - last_flush >= FLUSH_INTERVAL_SECONDS:
+                    csvfile.flush()
+                    last_flush = time.monotonic()
 
                 # Optional delay (be careful: too long causes buffer overflow)
                 if LOG_INTERVAL_SECONDS > 0:
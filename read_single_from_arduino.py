@@ -4,7 +4,6 @@ Serial Logger (Time + Single Selectable Channel)
 """
 
 import serial
-import csv
 import time
 import sys
 
@@ -19,6 +18,26 @@ SELECTED_CHANNEL = 3
 # Logging Interval
 LOG_INTERVAL_SECONDS = 1
 
+# Buffered rows are pushed to disk at most this often (and always on exit)
+FLUSH_INTERVAL_SECONDS = 1.0
+
+# Print every logged row (slows down fast logging)
+DEBUG = False
+
+# Non-ASCII bytes, e.g. the b'\xff\xfe' junk sent on connect. They are dropped
+# from each line before splitting, as decode(errors='ignore') used to do.
+HIGH_BYTES = bytes(range(128, 256))
+
+# float() parses bytes directly; non-numeric text such as a startup banner
+# raises ValueError
+def is_numeric(fields):
+    try:
+        for field in fields:
+            float(field)
+    except ValueError:
+        return False
+    return True
+
 def log_serial_data_to_csv(port, baud_rate, filename, channel_num):
     # Basic validation to ensure channel is valid
     if channel_num < 1 or channel_num > 4:
@@ -30,21 +49,24 @@ def log_serial_data_to_csv(port, baud_rate, filename, channel_num):
         ser.reset_input_buffer()
         print(f" Connected to {port} @ {baud_rate} baud.")
 
-        with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.writer(csvfile)
+        # Binary mode: serial bytes go straight to the file without decoding
+        # or re-encoding each sample. Rows end in \r\n, as csv.writer wrote them.
+        with open(filename, 'wb') as csvfile:
             
             # --- Dynamic Header ---
-            # Creates headers like: ['Time', 'Channel 2']
-            writer.writerow(['Time', f'Channel {channel_num}'])
+            # Creates headers like: Time,Channel 2
+            csvfile.write(f'Time,Channel {channel_num}\r\n'.encode())
 
             print(f"Logging Time and Channel {channel_num} to {filename}. Press Ctrl+C to stop.")
 
-            while True:
-                raw_line = ser.readline().decode(errors='ignore').strip()
+            # No flush per row (one syscall per sample); leaving the 'with' block,
+            # including on Ctrl+C, flushes whatever is still buffered.
+            last_flush = time.monotonic()
 
-                if raw_line:
-                    cols = raw_line.split()
+            while True:
+                cols = ser.readline().translate(None, HIGH_BYTES).split()
 
+                if cols:
                     # We need at least 5 columns to be safe 
                     # (Time, Ch1, Ch2, Ch3, Ch4)
                     if len(cols) >= 5:
@@ -56,13 +78,23 @@ def log_serial_data_to_csv(port, baud_rate, filename, channel_num):
                         # The index matches your channel_num exactly.
                         channel_val = cols[channel_num]
                         
-                        data_row = [time_val, channel_val]
-                        
-                        writer.writerow(data_row)
-                        csvfile.flush()
-                        print(f"Logged: {data_row}")
+                        if is_numeric((time_val, channel_val)):
+                            data_row = time_val + b',' + channel_val
+                            
+                            csvfile.write(data_row + b'\r\n')
+                            if DEBUG:
+                                print(f"Logged: {data_row.decode()}")
+                        else:
+                            print(f"Ignored malformed line: {b' '.join(cols).decode()}")
                     else:
-                        print(f"Ignored incomplete line: {cols}")
+                        print(f"Ignored incomplete line: {b' '.join(cols).decode()}")
+
+                # Checked on every pass, not only after a row is written, so
+                # logged rows still reach disk when the Arduino goes quiet
+                # (readline() then times out and returns b'')
+                if time.monotonic() - last_flush >= FLUSH_INTERVAL_SECONDS:
+                    csvfile.flush()
+                    last_flush = time.monotonic()
 
                 if LOG_INTERVAL_SECONDS > 0:
                     time.sleep(LOG_INTERVAL_SECONDS)